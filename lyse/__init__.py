@@ -55,9 +55,14 @@ delay_event = threading.Event()
 # a flag to determine whether we should wait for the delay event
 _delay_flag = False
 
-# get port that lyse is using for communication
+# get port that lyse is using for communication. The parsed labconfig and the
+# modification time of its file are kept so that analysis workers can reuse it
+# rather than parsing the file again, unless it has since been edited:
+_labconfig = None
+_labconfig_mtime = None
 try:
     _labconfig = LabConfig(required_params={"ports": ["lyse"]})
+    _labconfig_mtime = os.path.getmtime(_labconfig.config_path)
     _lyse_port = int(_labconfig.get('ports', 'lyse'))
 except Exception:
     _lyse_port = 42519
@@ -23,6 +23,8 @@ import time
 import traceback
 import queue
 import warnings
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 # 3rd party imports:
 splash.update_text('importing numpy')
@@ -203,7 +205,7 @@ class WebServer(ZMQServer):
         # call it needlessly often, whereas it only needs to be called prior to
         # sending the dataframe to a client requesting it, as we're doing now.
         df = self._copy_dataframe()
-        df.infer_objects()
+        df = df.infer_objects()
         return df
 
     def _extract_n_sequences_from_df(self, df, n_sequences):
@@ -279,13 +281,124 @@ class LyseMainWindow(QtWidgets.QMainWindow):
         return result
 
 
+class WorkerPool(object):
+    """Analysis subprocesses started ahead of time, so that adding or restarting
+    an analysis routine does not have to wait for a new Python interpreter to start
+    up and import lyse, matplotlib, h5py etc. Spare workers block before loading
+    any user code, until they are told which analysis routine they are to run.
+
+    A spare worker's environment and imported modules are those of when it
+    started, which may be long before it is given a routine. Settings read
+    from the labconfig when the routine is loaded are re-read if the file has
+    been edited since the worker started."""
+
+    def __init__(self, output_box_port, n_spare=1):
+        self.output_box_port = output_box_port
+        self.n_spare = n_spare
+        self.logger = logging.getLogger('lyse.WorkerPool')
+        self.spare_workers = queue.Queue()
+        # How many spare workers are in the process of starting up:
+        self.n_starting = 0
+        # Set by shutdown(), after which workers that finish starting up are told
+        # to exit rather than added to the pool:
+        self.shutting_down = False
+        self.lock = threading.Lock()
+        self.replenish()
+
+    def start_worker(self):
+        worker_path = os.path.join(LYSE_DIR, 'analysis_subprocess.py')
+        return process_tree.subprocess(
+            worker_path,
+            output_redirection_port=self.output_box_port,
+            startup_timeout=30,
+        )
+
+    def replenish(self):
+        """Start new spare workers in the background, if there are fewer than
+        n_spare either idle or starting up"""
+        with self.lock:
+            if self.shutting_down:
+                return
+            n_required = self.n_spare - self.spare_workers.qsize() - self.n_starting
+            n_required = max(n_required, 0)
+            self.n_starting += n_required
+        for _ in range(n_required):
+            thread = threading.Thread(target=self._start_spare_worker)
+            thread.daemon = True
+            thread.start()
+
+    def _start_spare_worker(self):
+        try:
+            child_handles = self.start_worker()
+        except Exception:
+            self.logger.exception('Could not start spare worker process')
+            child_handles = None
+        with self.lock:
+            self.n_starting -= 1
+            shutting_down = self.shutting_down
+            if child_handles is not None and not shutting_down:
+                self.spare_workers.put(child_handles)
+        if child_handles is not None and shutting_down:
+            to_worker, _, _ = child_handles
+            to_worker.put(None)
+
+    def get_worker(self, filepath):
+        """Return the to_worker, from_worker and worker handles of a worker
+        process that will run the analysis routine at the given filepath. A spare
+        worker is used if one is available, otherwise one is started now."""
+        while True:
+            try:
+                child_handles = self.spare_workers.get(False)
+            except queue.Empty:
+                child_handles = self.start_worker()
+                break
+            # Ensure the spare worker has not died whilst idle:
+            worker = child_handles[2]
+            worker.poll()
+            if worker.returncode is None:
+                break
+            self.logger.warning('Spare worker exited with code %s before use', worker.returncode)
+            self._close_dead_worker(child_handles)
+        self.replenish()
+        to_worker, from_worker, worker = child_handles
+        # Tell the worker what script it with be executing:
+        to_worker.put(filepath)
+        return to_worker, from_worker, worker
+
+    def shutdown(self):
+        """Tell all idle spare workers to exit, as well as any still starting up
+        once they are ready"""
+        with self.lock:
+            self.shutting_down = True
+        while True:
+            try:
+                child_handles = self.spare_workers.get(False)
+            except queue.Empty:
+                break
+            to_worker, _, worker = child_handles
+            worker.poll()
+            if worker.returncode is None:
+                to_worker.put(None)
+            else:
+                self._close_dead_worker(child_handles)
+
+    def _close_dead_worker(self, child_handles):
+        """Reap a worker process that has already exited and close the sockets
+        of its queues"""
+        to_worker, from_worker, worker = child_handles
+        worker.wait()
+        to_worker.sock.close(linger=0)
+        for sock in [from_worker.sock, from_worker.to_self, from_worker.from_self]:
+            sock.close(linger=0)
+
+
 class AnalysisRoutine(object):
 
-    def __init__(self, filepath, model, output_box_port, checked=QtCore.Qt.Checked):
+    def __init__(self, filepath, model, worker_pool, checked=QtCore.Qt.Checked):
         self.filepath = filepath
         self.shortname = os.path.basename(self.filepath)
         self.model = model
-        self.output_box_port = output_box_port
+        self.worker_pool = worker_pool
         
         self.COL_ACTIVE = RoutineBox.COL_ACTIVE
         self.COL_STATUS = RoutineBox.COL_STATUS
@@ -310,19 +423,8 @@ class AnalysisRoutine(object):
         self.exiting = False
         
     def start_worker(self):
-        # Start a worker process for this analysis routine:
-        worker_path = os.path.join(LYSE_DIR, 'analysis_subprocess.py')
-
-        child_handles = process_tree.subprocess(
-            worker_path,
-            output_redirection_port=self.output_box_port,
-            startup_timeout=30,
-        )
-        
-        to_worker, from_worker, worker = child_handles
-        # Tell the worker what script it with be executing:
-        to_worker.put(self.filepath)
-        return to_worker, from_worker, worker
+        # Get a worker process for this analysis routine:
+        return self.worker_pool.get_worker(self.filepath)
         
     def do_analysis(self, filepath):
         self.to_worker.put(['analyse', filepath])
@@ -488,13 +590,13 @@ class RoutineBox(object):
     # using remove/insert.
     ROLE_SORTINDEX = QtCore.Qt.UserRole + 2
     
-    def __init__(self, container, exp_config, filebox, from_filebox, to_filebox, output_box_port, multishot=False):
+    def __init__(self, container, exp_config, filebox, from_filebox, to_filebox, worker_pool, multishot=False):
         self.multishot = multishot
         self.filebox = filebox
         self.exp_config = exp_config
         self.from_filebox = from_filebox
         self.to_filebox = to_filebox
-        self.output_box_port = output_box_port
+        self.worker_pool = worker_pool
         
         self.logger = logging.getLogger('lyse.RoutineBox.%s'%('multishot' if multishot else 'singleshot'))  
         
@@ -612,7 +714,7 @@ class RoutineBox(object):
             if filepath in [routine.filepath for routine in self.routines]:
                 app.output_box.output('Warning: Ignoring duplicate analysis routine %s\n'%filepath, red=True)
                 continue
-            routine = AnalysisRoutine(filepath, self.model, self.output_box_port, checked)
+            routine = AnalysisRoutine(filepath, self.model, self.worker_pool, checked)
             self.routines.append(routine)
         self.update_select_all_checkstate()
         
@@ -777,9 +879,21 @@ class RoutineBox(object):
             self.logger.info('got a file to process: %s'%filepath)
             self.do_analysis(filepath)
     
+    @inmain_decorator()
+    def enabled_routines(self):
+        """Return the routines that are checked as active, in order. This walks
+        the model once, whereas calling enabled() on each routine searches the
+        model for that routine's row every time."""
+        enabled_filepaths = set()
+        for row in range(self.model.rowCount()):
+            if self.model.item(row, self.COL_ACTIVE).checkState() == QtCore.Qt.Checked:
+                name_item = self.model.item(row, self.COL_NAME)
+                enabled_filepaths.add(name_item.data(self.ROLE_FULLPATH))
+        return [r for r in self.routines if r.filepath in enabled_filepaths]
+
     def todo(self):
         """How many analysis routines are not done?"""
-        return len([r for r in self.routines if r.enabled() and not r.done])
+        return len([r for r in self.enabled_routines() if not r.done])
         
     def do_analysis(self, filepath):
         """Run all analysis routines once on the given filepath,
@@ -791,8 +905,8 @@ class RoutineBox(object):
         updated_data = {}
         while remaining:
             self.logger.debug('%d routines left to do'%remaining)
-            for routine in self.routines:
-                if routine.enabled() and not routine.done:
+            for routine in self.enabled_routines():
+                if not routine.done:
                     break
             else:
                 routine = None
@@ -810,8 +924,9 @@ class RoutineBox(object):
                     break
             # Race conditions here, but it's only for reporting percent done
             # so it doesn't matter if it's wrong briefly:
-            remaining = self.todo()
-            total = len([r for r in self.routines if r.enabled()])
+            enabled_routines = self.enabled_routines()
+            remaining = len([r for r in enabled_routines if not r.done])
+            total = len(enabled_routines)
             done = total - remaining
             try:
                 status_percent = 100*float(done)/(remaining + done)
@@ -896,6 +1011,9 @@ class EditColumns(object):
         self.action_set_selected_hidden = QtWidgets.QAction(
             QtGui.QIcon(':qtutils/fugue/ui-check-box-uncheck'), 'Hide selected columns',  self.ui)
 
+        # The column names the model currently has rows for:
+        self.populated_column_names = None
+
         self.connect_signals()
         self.populate_model(column_names, self.columns_visible)
 
@@ -918,19 +1036,44 @@ class EditColumns(object):
             lambda: self.on_set_selected_triggered(QtCore.Qt.Unchecked))
 
     def populate_model(self, column_names, columns_visible):
+        # Remove our special columns from the dict of column names by keeping only tuples:
+        column_names = {i: name for i, name in column_names.items() if isinstance(name, tuple)}
+
+        if column_names == self.populated_column_names:
+            # The model already has rows for these columns, only their check
+            # states need updating:
+            self.n_rows_checked = 0
+            with self.model_item_changed_disconnected:
+                for row, column_index in self.column_indices.items():
+                    if columns_visible[column_index]:
+                        state = QtCore.Qt.Checked
+                        self.n_rows_checked += 1
+                    else:
+                        state = QtCore.Qt.Unchecked
+                    visible_item = self.model.item(row, self.COL_VISIBLE)
+                    visible_item.setCheckState(state)
+                    visible_item.setData(state, self.ROLE_SORT_DATA)
+            self.update_select_all_checkstate()
+            self.do_sort()
+            return
+
         self.model.clear()
         self.model.setHorizontalHeaderLabels(['', 'Name'])
         self.header.setWidget(self.COL_VISIBLE, self.select_all_checkbox)
         self.ui.treeView.resizeColumnToContents(self.COL_VISIBLE)
         # Which indices in self.columns_visible the row numbers correspond to
         self.column_indices = {}
-
-        # Remove our special columns from the dict of column names by keeping only tuples:
-        column_names = {i: name for i, name in column_names.items() if isinstance(name, tuple)}
+        # How many of the rows are checked, so that the state of the select all
+        # checkbox can be determined without inspecting every row:
+        self.n_rows_checked = 0
 
         # Sort the column names as comma separated values, converting to lower case:
         sortkey = lambda item: ', '.join(item[1]).lower().strip(', ')
 
+        # Don't have the view or proxy model re-sort and re-filter after each row
+        # is added, rows are sorted once at the end instead:
+        self.ui.treeView.setSortingEnabled(False)
+        self.proxy_model.setDynamicSortFilter(False)
         for column_index, name in sorted(column_names.items(), key=sortkey):
             visible = columns_visible[column_index]
             visible_item = QtGui.QStandardItem()
@@ -938,6 +1081,7 @@ class EditColumns(object):
             if visible:
                 visible_item.setCheckState(QtCore.Qt.Checked)
                 visible_item.setData(QtCore.Qt.Checked, self.ROLE_SORT_DATA)
+                self.n_rows_checked += 1
             else:
                 visible_item.setCheckState(QtCore.Qt.Unchecked)
                 visible_item.setData(QtCore.Qt.Unchecked, self.ROLE_SORT_DATA)
@@ -946,10 +1090,14 @@ class EditColumns(object):
             name_item.setData(sortkey((column_index, name)), self.ROLE_SORT_DATA)
             self.model.appendRow([visible_item, name_item])
             self.column_indices[self.model.rowCount() - 1] = column_index
+        self.proxy_model.setDynamicSortFilter(True)
 
         self.ui.treeView.resizeColumnToContents(self.COL_NAME)
         self.update_select_all_checkstate()
-        self.ui.treeView.sortByColumn(self.COL_NAME, QtCore.Qt.AscendingOrder)
+        # Re-enabling sorting sorts by the sort indicator, once:
+        self.header.setSortIndicator(self.COL_NAME, QtCore.Qt.AscendingOrder)
+        self.ui.treeView.setSortingEnabled(True)
+        self.populated_column_names = column_names
 
     def on_treeView_context_menu_requested(self, point):
         menu = QtWidgets.QMenu(self.ui)
@@ -959,10 +1107,11 @@ class EditColumns(object):
 
     def on_set_selected_triggered(self, visible):
         selected_indexes = self.ui.treeView.selectedIndexes()
-        selected_rows = set(self.proxy_model.mapToSource(index).row() for index in selected_indexes)
+        map_to_source = self.proxy_model.mapToSource
+        selected_rows = set(map_to_source(index).row() for index in selected_indexes)
+        model_item = self.model.item
         for row in selected_rows:
-            visible_item = self.model.item(row, self.COL_VISIBLE)
-            self.update_visible_state(visible_item, visible)
+            self.update_visible_state(model_item(row, self.COL_VISIBLE), visible)
         self.update_select_all_checkstate()
         self.do_sort()
         self.filebox.set_columns_visible(self.columns_visible)
@@ -975,9 +1124,9 @@ class EditColumns(object):
             # Do not allow a switch *to* a partially checked state:
             self.select_all_checkbox.setTristate(False)
         state = self.select_all_checkbox.checkState()
+        model_item = self.model.item
         for row in range(self.model.rowCount()):
-            visible_item = self.model.item(row, self.COL_VISIBLE)
-            self.update_visible_state(visible_item, state)
+            self.update_visible_state(model_item(row, self.COL_VISIBLE), state)
         self.do_sort()
         
         self.filebox.set_columns_visible(self.columns_visible)
@@ -985,23 +1134,20 @@ class EditColumns(object):
     def update_visible_state(self, item, state):
         assert item.column() == self.COL_VISIBLE, "unexpected column"
         row = item.row()
+        column_index = self.column_indices[row]
+        visible = state == QtCore.Qt.Checked
+        if visible != self.columns_visible[column_index]:
+            self.n_rows_checked += 1 if visible else -1
         with self.model_item_changed_disconnected:
             item.setCheckState(state)
             item.setData(state, self.ROLE_SORT_DATA)
-            if state == QtCore.Qt.Checked:
-                self.columns_visible[self.column_indices[row]] = True
-            else:
-                self.columns_visible[self.column_indices[row]] = False
+            self.columns_visible[column_index] = visible
 
     def update_select_all_checkstate(self):
         with self.select_all_checkbox_state_changed_disconnected:
-            all_states = []
-            for row in range(self.model.rowCount()):
-                visible_item = self.model.item(row, self.COL_VISIBLE)
-                all_states.append(visible_item.checkState())
-            if all(state == QtCore.Qt.Checked for state in all_states):
+            if self.n_rows_checked == self.model.rowCount():
                 self.select_all_checkbox.setCheckState(QtCore.Qt.Checked)
-            elif all(state == QtCore.Qt.Unchecked for state in all_states):
+            elif self.n_rows_checked == 0:
                 self.select_all_checkbox.setCheckState(QtCore.Qt.Unchecked)
             else:
                 self.select_all_checkbox.setCheckState(QtCore.Qt.PartiallyChecked)
@@ -1121,6 +1267,76 @@ class UneditableModel(QtGui.QStandardItemModel):
         return result & ~QtCore.Qt.ItemIsEditable
 
 
+class DataFrameItemModel(UneditableModel):
+    """An UneditableModel in which only the status and filepath columns are
+    stored as items. Data for all other columns is read from the dataframe of
+    the given DataFrameModel on demand, so that items do not need to be
+    created or updated for every cell, only the cells that are actually
+    displayed are formatted as strings. Formatted strings are cached by row
+    until invalidate_display_text() is called for that row."""
+
+    def __init__(self, dataframe_model):
+        UneditableModel.__init__(self)
+        self.dataframe_model = dataframe_model
+        self._display_text = {}
+        # Positions in the dataframe of the columns in the model, by column number,
+        # and the dataframe columns they were computed for:
+        self._dataframe_column_positions = {}
+        self._dataframe_columns = None
+
+    def invalidate_display_text(self, row=None):
+        """Discard cached display text for the given row, or for all rows if
+        row is None"""
+        if row is None:
+            self._display_text = {}
+            self._dataframe_columns = None
+        else:
+            self._display_text.pop(row, None)
+
+    def dataframe_column_position(self, column):
+        """Return the position in the dataframe of the given column of the model,
+        or None if it is not in the dataframe"""
+        columns = self.dataframe_model.dataframe.columns
+        if columns is not self._dataframe_columns:
+            position_by_name = {name: position for position, name in enumerate(columns)}
+            self._dataframe_column_positions = {
+                column_number: position_by_name[name]
+                for column_number, name in self.dataframe_model.column_names.items()
+                if name in position_by_name
+            }
+            self._dataframe_columns = columns
+        return self._dataframe_column_positions.get(column)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if index.column() <= self.dataframe_model.COL_FILEPATH:
+            return UneditableModel.data(self, index, role)
+        if role == QtCore.Qt.TextAlignmentRole:
+            return QtCore.Qt.AlignCenter
+        if role not in (QtCore.Qt.DisplayRole, QtCore.Qt.ToolTipRole):
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            try:
+                return self._display_text[index.row()][index.column()]
+            except KeyError:
+                pass
+        position = self.dataframe_column_position(index.column())
+        if position is None or index.row() >= len(self.dataframe_model.dataframe):
+            # The dataframe and model are mid-update, nothing to show:
+            return None
+        value = self.dataframe_model.dataframe.iat[index.row(), position]
+        if role == QtCore.Qt.ToolTipRole:
+            return repr(value)
+        if isinstance(value, float):
+            value_str = scientific_notation(value)
+        else:
+            value_str = str(value)
+        lines = value_str.splitlines()
+        if len(lines) > 1:
+            value_str = lines[0] + ' ...'
+        self._display_text.setdefault(index.row(), {})[index.column()] = value_str
+        return value_str
+
+
 class TableView(QtWidgets.QTableView):
     leftClicked = Signal(QtCore.QModelIndex)
     doubleLeftClicked = Signal(QtCore.QModelIndex)
@@ -1184,9 +1400,17 @@ class DataFrameModel(QtCore.QObject):
         QtCore.QObject.__init__(self)
         self._view = view
         self.exp_config = exp_config
-        self._model = UneditableModel()
+        self._model = DataFrameItemModel(self)
         self.row_number_by_filepath = {}
+        # The inverse mapping, as a list:
+        self.filepath_by_row = []
         self._previous_n_digits = 0
+        # All rows before this one are known to have been analysed:
+        self._first_incomplete_row = 0
+        # How many shots have not been analysed:
+        self.n_incomplete = 0
+        # Shot file names without directory or extension, for row labels:
+        self._basename_by_filepath = {}
 
         self._header = HorizontalHeaderViewWithWidgets(self._model)
         self._vertheader = QtWidgets.QHeaderView(QtCore.Qt.Vertical)
@@ -1221,6 +1445,11 @@ class DataFrameModel(QtCore.QObject):
         self.dataframe = pandas.DataFrame({'filepath': []}, columns=index)
         # How many levels the dataframe's multiindex has:
         self.nlevels = self.dataframe.columns.nlevels
+        self.update_column_name_padding()
+
+        # Icons for the status column, made once rather than every time they are set:
+        self._icon_tick = QtGui.QIcon(':qtutils/fugue/tick')
+        self._icon_deleted_off_disk = QtGui.QIcon(':qtutils/fugue/drive--minus')
 
         status_item = QtGui.QStandardItem()
         status_item.setIcon(QtGui.QIcon(':qtutils/fugue/information'))
@@ -1238,6 +1467,13 @@ class DataFrameModel(QtCore.QObject):
         self.column_indices = {'__status': self.COL_STATUS, ('filepath', ''): self.COL_FILEPATH}
         self.column_names = {self.COL_STATUS: '__status', self.COL_FILEPATH: ('filepath', '')}
         self.columns_visible = {self.COL_STATUS: True, self.COL_FILEPATH: True}
+        # The dataframe's columns as of when the columns of the Qt model were last
+        # made to match them:
+        self._synced_columns = None
+        # Names of new columns yet to be resized to fit their contents:
+        self._columns_to_resize = set()
+        # Column visibility as last set in the view by set_columns_visible():
+        self._columns_visible_in_view = {}
 
         # Whether or not a deleted column was visible at the time it was deleted (by name):
         self.deleted_columns_visible = {}
@@ -1263,14 +1499,37 @@ class DataFrameModel(QtCore.QObject):
             return
         if confirm and not question_dialog("Remove %d shots?" % len(selected_name_items)):
             return
-        # Remove from DataFrame first:
-        self.dataframe = self.dataframe.drop(index.row() for index in selected_indexes)
-        self.dataframe.index = pandas.Index(range(len(self.dataframe)))
-        # Delete one at a time from Qt model:
-        for name_item in selected_name_items:
-            row = name_item.row()
-            self._model.removeRow(row)
-        self.renumber_rows()
+        # selectedRows() gives indices in the status column:
+        self.n_incomplete -= sum(status_item.data(self.ROLE_STATUS_PERCENT) != 100
+                                 for status_item in selected_name_items)
+        # Remove from DataFrame first, taking the rows to keep in a single operation:
+        rows_to_keep = np.ones(len(self.dataframe), dtype=bool)
+        rows_to_keep[[index.row() for index in selected_indexes]] = False
+        self.dataframe = self.dataframe.iloc[rows_to_keep]
+        self.dataframe.index = pandas.RangeIndex(len(self.dataframe))
+        self._model.invalidate_display_text()
+        self.filepath_by_row = list(self.dataframe['filepath'].values)
+        self.row_number_by_filepath = {
+            filepath: row_number for row_number, filepath in enumerate(self.filepath_by_row)
+        }
+        self._basename_by_filepath = {
+            filepath: basename for filepath, basename in self._basename_by_filepath.items()
+            if filepath in self.row_number_by_filepath
+        }
+        # Delete from the Qt model, one contiguous range of rows at a time. In
+        # reverse order so that removals do not change the position of rows yet
+        # to be removed:
+        rows = sorted((index.row() for index in selected_indexes), reverse=True)
+        # Rows before the first removed one keep their positions:
+        self._first_incomplete_row = min(self._first_incomplete_row, rows[-1])
+        last = rows[0]
+        for first, next_row in zip(rows, rows[1:] + [None]):
+            if next_row != first - 1:
+                self._model.removeRows(first, last - first + 1)
+                last = next_row
+        # Rows before the first removed one have not moved, so their labels are
+        # still correct:
+        self.renumber_rows(add_from=rows[-1])
 
     def mark_selection_not_done(self):
         selected_indexes = self._view.selectedIndexes()
@@ -1282,15 +1541,18 @@ class DataFrameModel(QtCore.QObject):
                 # see if it's readable now. It may have been undeleted or
                 # perhaps it being unreadable before was due to a network
                 # glitch or similar.
-                filepath = self._model.item(row, self.COL_FILEPATH).text()
+                filepath = self.filepath_by_row[row]
                 if not os.path.exists(filepath):
                     continue
                 # Shot file is accesible again:
                 status_item.setData(False, self.ROLE_DELETED_OFF_DISK)
-                status_item.setIcon(QtGui.QIcon(':qtutils/fugue/tick'))
+                status_item.setIcon(self._icon_tick)
                 status_item.setToolTip(None)
 
+            if status_item.data(self.ROLE_STATUS_PERCENT) == 100:
+                self.n_incomplete += 1
             status_item.setData(0, self.ROLE_STATUS_PERCENT)
+            self._first_incomplete_row = min(self._first_incomplete_row, row)
         
     def on_view_context_menu_requested(self, point):
         menu = QtWidgets.QMenu(self._view)
@@ -1298,8 +1560,7 @@ class DataFrameModel(QtCore.QObject):
         menu.exec_(QtGui.QCursor.pos())
 
     def on_double_click(self, index):
-        filepath_item = self._model.item(index.row(), self.COL_FILEPATH)
-        shot_filepath = filepath_item.text()
+        shot_filepath = self.filepath_by_row[index.row()]
         
         # get path to text editor
         viewer_path = self.exp_config.get('programs', 'hdf5_viewer')
@@ -1322,7 +1583,9 @@ class DataFrameModel(QtCore.QObject):
     def set_columns_visible(self, columns_visible):
         self.columns_visible = columns_visible
         for column_index, visible in columns_visible.items():
-            self._view.setColumnHidden(column_index, not visible)
+            if self._columns_visible_in_view.get(column_index) != visible:
+                self._view.setColumnHidden(column_index, not visible)
+                self._columns_visible_in_view[column_index] = visible
 
     def update_column_levels(self):
         """Pads the keys and values of our lists of column names so that
@@ -1332,6 +1595,7 @@ class DataFrameModel(QtCore.QObject):
         extra_levels = self.dataframe.columns.nlevels - self.nlevels
         if extra_levels > 0:
             self.nlevels = self.dataframe.columns.nlevels
+            self.update_column_name_padding()
             column_indices = {}
             column_names = {}
             for column_name in self.column_indices:
@@ -1346,11 +1610,18 @@ class DataFrameModel(QtCore.QObject):
             self.column_indices = column_indices
             self.column_names = column_names
 
+    def update_column_name_padding(self):
+        """Store the padding needed to make (group, name) tuples the full length of
+        column names in the dataframe, and the full name of the filepath column, for
+        the current number of levels in its multiindex"""
+        self._result_column_name_padding = ('',) * (self.nlevels - 2)
+        self._filepath_column_name = ('filepath',) + ('',) * (self.nlevels - 1)
+
     @inmain_decorator()
     def mark_as_deleted_off_disk(self, filepath):
         # Confirm the shot hasn't been removed from lyse (we are in the main
         # thread so there is no race condition in checking first)
-        if not filepath in self.dataframe['filepath'].values:
+        if not filepath in self.row_number_by_filepath:
             # Shot has been removed from FileBox, nothing to do here:
             return
 
@@ -1363,9 +1634,11 @@ class DataFrameModel(QtCore.QObject):
         # important so that the shot is not picked up as analysis
         # incomplete and analysis re-attempted on it.
         status_item.setData(True, self.ROLE_DELETED_OFF_DISK)
+        if status_item.data(self.ROLE_STATUS_PERCENT) != 100:
+            self.n_incomplete -= 1
         status_item.setData(100, self.ROLE_STATUS_PERCENT)
         status_item.setToolTip("Shot has been deleted off disk or is unreadable")
-        status_item.setIcon(QtGui.QIcon(':qtutils/fugue/drive--minus'))
+        status_item.setIcon(self._icon_deleted_off_disk)
         app.output_box.output('Warning: Shot deleted from disk or no longer readable %s\n' % filepath, red=True)
 
     @inmain_decorator()
@@ -1376,14 +1649,40 @@ class DataFrameModel(QtCore.QObject):
         non-mixed numerical data, which it might choke on.
         """
         self.dataframe = self.dataframe.infer_objects()
+        self._model.invalidate_display_text()
+
+    @staticmethod
+    def column_dtype_for_value(dtype, value):
+        """Return the dtype that a column with numpy dtype dtype needs in order to
+        hold value: dtype itself if the value fits, float64 if an integer or boolean
+        column receives a float or missing value, and 'object' otherwise."""
+        if value is None or (isinstance(value, (float, np.floating)) and np.isnan(value)):
+            # A missing value, e.g. from a failed fit, is stored as NaN:
+            value_dtype = np.dtype(np.float64)
+        elif isinstance(value, np.ndarray):
+            if value.ndim:
+                return np.dtype(object)
+            value_dtype = value.dtype
+        elif isinstance(value, (list, tuple, dict, set)):
+            return np.dtype(object)
+        else:
+            try:
+                if np.ndim(value):
+                    return np.dtype(object)
+            except ValueError:
+                # A ragged nested sequence:
+                return np.dtype(object)
+            value_dtype = np.asarray(value).dtype
+        if np.can_cast(value_dtype, dtype, casting='same_kind'):
+            return dtype
+        if dtype.kind in 'iub' and value_dtype.kind == 'f':
+            return np.dtype(np.float64)
+        return np.dtype(object)
 
     @inmain_decorator()
     def update_row(self, filepath, dataframe_already_updated=False, new_row_data=None, updated_row_data=None):
         """"Updates a row in the dataframe and Qt model to the data in the HDF5 file for
         that shot."""
-        # To speed things up block signals to the model during update
-        self._model.blockSignals(True)
-
         # Update the row in the dataframe first:
         if (new_row_data is None) == (updated_row_data is None) and not dataframe_already_updated:
             raise ValueError('Exactly one of new_row_data or updated_row_data must be provided')
@@ -1394,26 +1693,37 @@ class DataFrameModel(QtCore.QObject):
             # Row has been deleted, nothing to do here:
             return
 
-        filepath_colname = ('filepath',) + ('',) * (self.nlevels - 1)
-        assert filepath == self.dataframe.at[row_number, filepath_colname]
+        assert filepath == self.dataframe.at[row_number, self._filepath_column_name]
 
         if updated_row_data is not None and not dataframe_already_updated:
-            for group, name in updated_row_data:
-                column_name = (group, name) + ('',) * (self.nlevels - 2)
-                value = updated_row_data[group, name]
-                try:
-                    self.dataframe.at[row_number, column_name] = value
-                except ValueError:
-                    # did the column not already exist when we tried to set an iterable?
-                    if not column_name in self.dataframe.columns:
-                        # create it with a non-iterable and then overwrite with the iterable value:
-                        self.dataframe.at[row_number, column_name] = None
-                    else:
-                        # Incompatible datatype - convert the datatype of the column to
-                        # 'object'
-                        self.dataframe[column_name] = self.dataframe[column_name].astype('object')
-                    # Now that the column exists and has dtype object, we can set the value:
-                    self.dataframe.at[row_number, column_name] = value
+            values_by_column_name = {(group, name) + self._result_column_name_padding: value
+                                     for (group, name), value in updated_row_data.items()}
+            missing_column_names = [column_name for column_name in values_by_column_name
+                                    if column_name not in self.dataframe.columns]
+            if missing_column_names:
+                # Add all new columns at once rather than one at a time, each of which
+                # would copy the dataframe. They have dtype 'object' so that values of
+                # any type can be set in them, and are given more specific dtypes
+                # once their values are set below:
+                new_columns = pandas.DataFrame(index=self.dataframe.index,
+                                               columns=pandas.MultiIndex.from_tuples(missing_column_names),
+                                               dtype='object')
+                self.dataframe = pandas.concat([self.dataframe, new_columns], axis=1)
+            dtypes = self.dataframe.dtypes
+            for column_name, value in values_by_column_name.items():
+                dtype = dtypes[column_name]
+                if isinstance(dtype, np.dtype) and dtype != object:
+                    new_dtype = self.column_dtype_for_value(dtype, value)
+                    if new_dtype != dtype:
+                        # Incompatible datatype - convert the datatype of the column so
+                        # that we can set the value:
+                        self.dataframe[column_name] = self.dataframe[column_name].astype(new_dtype)
+                self.dataframe.at[row_number, column_name] = value
+            for column_name in missing_column_names:
+                # Pick a specific dtype for each new column from its value, e.g.
+                # float64 for a float result, as setting the value in a new
+                # column one element at a time would have:
+                self.dataframe[column_name] = self.dataframe[column_name].infer_objects()
 
             dataframe_already_updated = True
 
@@ -1424,8 +1734,45 @@ class DataFrameModel(QtCore.QObject):
             self.dataframe = replace_with_padding(self.dataframe, new_row_data, row_number)
             self.update_column_levels()
 
-        # Check and create necessary new columns in the Qt model:
-        new_column_names = set(self.dataframe.columns) - set(self.column_names.values())
+        self.update_model(row_number, row_number)
+
+    def update_model(self, first_row, last_row):
+        """Update the columns of the Qt model to match the dataframe, and tell views
+        that data in the given range of rows may have changed"""
+        if self.update_model_columns():
+            # Column numbers have changed, so cached display text for all rows is
+            # now misplaced:
+            self._model.invalidate_display_text()
+            self._model.layoutChanged.emit()
+        else:
+            for row_number in range(first_row, last_row + 1):
+                self._model.invalidate_display_text(row_number)
+            # Only the data in these rows can have changed, so only they need repainting:
+            self._model.dataChanged.emit(self._model.index(first_row, 0),
+                                         self._model.index(last_row, self._model.columnCount() - 1))
+
+    def update_model_columns(self):
+        """Create and remove columns in the Qt model to match those in the
+        dataframe. Returns whether any columns were created or removed. Signals
+        to the model are blocked whilst doing so, and so views must be told of any
+        changes afterwards with layoutChanged."""
+        # To speed things up block signals to the model during update
+        self._model.blockSignals(True)
+
+        # Find which columns need to be created or removed in the Qt model. A pandas
+        # Index is immutable, so if the dataframe's columns are the same object as
+        # the last time we did this, there is nothing to do:
+        if self.dataframe.columns is self._synced_columns:
+            new_column_names = set()
+            defunct_column_names = set()
+        else:
+            dataframe_column_names = set(self.dataframe.columns)
+            new_column_names = dataframe_column_names - self.column_indices.keys()
+            defunct_column_names = (self.column_indices.keys() - dataframe_column_names
+                                    - {self.column_names[self.COL_STATUS], self.column_names[self.COL_FILEPATH]})
+            self._synced_columns = self.dataframe.columns
+
+        # Create necessary new columns in the Qt model:
         new_columns_start = self._model.columnCount()
         self._model.insertColumns(new_columns_start, len(new_column_names))
         for i, column_name in enumerate(sorted(new_column_names)):
@@ -1447,9 +1794,7 @@ class DataFrameModel(QtCore.QObject):
             header_item.setToolTip(column_name_as_string)
             self._model.setHorizontalHeaderItem(column_number, header_item)
 
-        # Check and remove any no-longer-needed columns in the Qt model:
-        defunct_column_names = (set(self.column_names.values()) - set(self.dataframe.columns)
-                                - {self.column_names[self.COL_STATUS], self.column_names[self.COL_FILEPATH]})
+        # Remove any no-longer-needed columns in the Qt model:
         defunct_column_indices = [self.column_indices[column_name] for column_name in defunct_column_names]
         for column_number in sorted(defunct_column_indices, reverse=True):
             # Remove columns from the Qt model. In reverse order so that
@@ -1463,54 +1808,51 @@ class DataFrameModel(QtCore.QObject):
             del self.columns_visible[column_number]
 
         if defunct_column_indices:
-            # Renumber the keys of self.columns_visible and self.column_names to reflect deletions:
-            self.column_names = {newindex: name for newindex, (oldindex, name) in enumerate(sorted(self.column_names.items()))}
-            self.columns_visible = {newindex: visible for newindex, (oldindex, visible) in enumerate(sorted(self.columns_visible.items()))}
-            # Update the inverse mapping of self.column_names:
-            self.column_indices = {name: index for index, name in self.column_names.items()}
-
-        # Update the data in the Qt model:
-        dataframe_row = self.dataframe.iloc[row_number].to_dict()
-        for column_number, column_name in self.column_names.items():
-            if not isinstance(column_name, tuple):
-                # One of our special columns, does not correspond to a column in the dataframe:
-                continue
-            if updated_row_data is not None:
-                # Must remove empty strings from tuple to compare with updated_row_data:
-                if tuple(s for s in column_name if s) not in updated_row_data:
-                    continue
-            value = dataframe_row[column_name]
-            if isinstance(value, float):
-                value_str = scientific_notation(value)
-            else:
-                value_str = str(value)
-            lines = value_str.splitlines()
-            if len(lines) > 1:
-                short_value_str = lines[0] + ' ...'
-            else:
-                short_value_str = value_str
-
-            item = self._model.item(row_number, column_number)
-            if item is None:
-                # This is the first time we've written a value to this part of the model:
-                item = QtGui.QStandardItem(short_value_str)
-                item.setData(QtCore.Qt.AlignCenter, QtCore.Qt.TextAlignmentRole)
-                self._model.setItem(row_number, column_number, item)
-            else:
-                item.setText(short_value_str)
-            item.setToolTip(repr(value))
+            # Renumber the keys of self.columns_visible and self.column_names to reflect
+            # deletions, and update the inverse mapping of self.column_names. Both
+            # dicts have always had their keys inserted in increasing order, so they
+            # do not need sorting first:
+            column_names = {}
+            columns_visible = {}
+            column_indices = {}
+            for newindex, (oldindex, name) in enumerate(self.column_names.items()):
+                column_names[newindex] = name
+                columns_visible[newindex] = self.columns_visible[oldindex]
+                column_indices[name] = newindex
+            self.column_names = column_names
+            self.columns_visible = columns_visible
+            self.column_indices = column_indices
 
-        for i, column_name in enumerate(sorted(new_column_names)):
-            # Resize any new columns to fit contents:
-            column_number = new_columns_start + i
-            self._view.resizeColumnToContents(column_number)
+        # The Qt model reads data from the dataframe as it is displayed, so
+        # there is nothing more to update in it other than its columns.
+
+        if new_column_names:
+            # Resize any new columns to fit contents. This is deferred until control
+            # returns to the event loop, so that columns created by many calls to
+            # update_row() in a row are each measured only once:
+            if not self._columns_to_resize:
+                QtCore.QTimer.singleShot(0, self.resize_new_columns)
+            self._columns_to_resize.update(new_column_names)
+
+        # unblock signals to the model
+        self._model.blockSignals(False)
 
         if new_column_names or defunct_column_names:
+            # Column numbers may now refer to different columns:
+            self._columns_visible_in_view = {}
             self.columns_changed.emit()
+            return True
+        return False
 
-        # unblock signals to the model and tell it to update
-        self._model.blockSignals(False)
-        self._model.layoutChanged.emit()
+    def resize_new_columns(self):
+        for column_name in self._columns_to_resize:
+            try:
+                column_number = self.column_indices[column_name]
+            except KeyError:
+                # Column has been removed already, nothing to do here:
+                continue
+            self._view.resizeColumnToContents(column_number)
+        self._columns_to_resize = set()
 
     @inmain_decorator()
     def set_status_percent(self, filepath, status_percent):
@@ -1520,16 +1862,20 @@ class DataFrameModel(QtCore.QObject):
             # Row has been deleted, nothing to do here:
             return
         status_item = self._model.item(row_number, self.COL_STATUS)
+        was_incomplete = status_item.data(self.ROLE_STATUS_PERCENT) != 100
+        self.n_incomplete += (status_percent != 100) - was_incomplete
         status_item.setData(status_percent, self.ROLE_STATUS_PERCENT)
+        if status_percent != 100:
+            self._first_incomplete_row = min(self._first_incomplete_row, row_number)
 
     def new_row(self, filepath, done=False):
         status_item = QtGui.QStandardItem()
         if done:
             status_item.setData(100, self.ROLE_STATUS_PERCENT)
-            status_item.setIcon(QtGui.QIcon(':/qtutils/fugue/tick'))
         else:
             status_item.setData(0, self.ROLE_STATUS_PERCENT)
-        status_item.setIcon(QtGui.QIcon(':qtutils/fugue/tick'))
+        # The icon is only shown once status is 100%, so set it regardless:
+        status_item.setIcon(self._icon_tick)
         name_item = QtGui.QStandardItem(filepath)
         return [status_item, name_item]
 
@@ -1538,36 +1884,41 @@ class DataFrameModel(QtCore.QObject):
         order for easy comparison with the dataframe. add_from allows you to
         only add numbers for new rows from the given index as a performance
         optimisation, though if the number of digits changes, all rows will
-        still be renumbered. add_from should not be used if rows have been
-        deleted."""
+        still be renumbered. If rows have been deleted, add_from must be no
+        greater than the first deleted row."""
         n_digits = len(str(self._model.rowCount()))
         if n_digits != self._previous_n_digits:
             # All labels must be updated:
             add_from = 0
         self._previous_n_digits = n_digits
 
-        if add_from == 0:
-            self.row_number_by_filepath = {}
-
+        filepaths = self.filepath_by_row
+        if self.integer_indexing:
+            # Get the columns and where they are not null up front, rather than
+            # looking them up for each row:
+            header_cols = ['sequence_index', 'run number', 'run repeat']
+            header_values = [self.dataframe[col].values for col in header_cols]
+            header_notna = [pandas.notna(values) for values in header_values]
+        vertical_header_item_at = self._model.verticalHeaderItem
         for row_number in range(add_from, self._model.rowCount()):
-            vertical_header_item = self._model.verticalHeaderItem(row_number)
+            vertical_header_item = vertical_header_item_at(row_number)
             row_number_str = str(row_number).rjust(n_digits)
             vert_header_text = '{}. '.format(row_number_str)
-            filepath_item = self._model.item(row_number, self.COL_FILEPATH)
-            filepath = filepath_item.text()
-            self.row_number_by_filepath[filepath] = row_number
+            filepath = filepaths[row_number]
             if self.integer_indexing:
-                header_cols = ['sequence_index', 'run number', 'run repeat']
                 header_strings = []
-                for col in header_cols:
-                    val = self.dataframe[col].values[row_number]
-                    if pandas.notna(val):
-                        header_strings.append('{:04d}'.format(val))
+                for values, notna in zip(header_values, header_notna):
+                    if notna[row_number]:
+                        header_strings.append('{:04d}'.format(values[row_number]))
                     else:
                         header_strings.append('----')
                 vert_header_text += ' | '.join(header_strings)
             else:
-                basename = os.path.splitext(os.path.basename(filepath))[0]
+                try:
+                    basename = self._basename_by_filepath[filepath]
+                except KeyError:
+                    basename = os.path.splitext(os.path.basename(filepath))[0]
+                    self._basename_by_filepath[filepath] = basename
                 vert_header_text += basename
             vertical_header_item.setText(vert_header_text)
     
@@ -1577,17 +1928,23 @@ class DataFrameModel(QtCore.QObject):
         dataframe containing the new rows."""
 
         to_add = []
+        to_add_set = set()
 
         # Check for duplicates:
         for filepath in filepaths:
-            if filepath in self.row_number_by_filepath or filepath in to_add:
+            if filepath in self.row_number_by_filepath or filepath in to_add_set:
                 app.output_box.output('Warning: Ignoring duplicate shot %s\n' % filepath, red=True)
-                if new_row_data is not None:
-                    df_row_index = np.where(new_row_data['filepath'].values == filepath)
-                    new_row_data = new_row_data.drop(df_row_index[0])
-                    new_row_data.index = pandas.Index(range(len(new_row_data)))
             else:
                 to_add.append(filepath)
+                to_add_set.add(filepath)
+
+        if new_row_data is not None and len(to_add) < len(new_row_data):
+            # Drop the rows of duplicates all at once, keeping the first row for
+            # each shot being added:
+            filepath_column = new_row_data['filepath']
+            rows_to_keep = (filepath_column.isin(to_add_set) & ~filepath_column.duplicated()).values
+            new_row_data = new_row_data.iloc[rows_to_keep]
+            new_row_data.index = pandas.RangeIndex(len(new_row_data))
 
         assert len(new_row_data) == len(to_add)
 
@@ -1598,18 +1955,38 @@ class DataFrameModel(QtCore.QObject):
 
         app.filebox.set_add_shots_progress(None, None, "updating filebox")
 
-        for filepath in to_add:
-            # Add the new rows to the Qt model:
-            self._model.appendRow(self.new_row(filepath, done=done))
-            vert_header_item = QtGui.QStandardItem('...loading...')
-            self._model.setVerticalHeaderItem(self._model.rowCount() - 1, vert_header_item)
-            self._view.resizeRowToContents(self._model.rowCount() - 1)
+        if to_add:
+            # Add the new rows to the Qt model. Insert them all at once, and then
+            # fill them in with signals to the model blocked, so that views get one
+            # notification of each kind rather than several per row:
+            first_new_row = self._model.rowCount()
+            last_new_row = first_new_row + len(to_add) - 1
+            self._model.insertRows(first_new_row, len(to_add))
+            self._model.blockSignals(True)
+            for row_number, filepath in enumerate(to_add, first_new_row):
+                for column_number, item in enumerate(self.new_row(filepath, done=done)):
+                    self._model.setItem(row_number, column_number, item)
+                self.row_number_by_filepath[filepath] = row_number
+                self.filepath_by_row.append(filepath)
+                vert_header_item = QtGui.QStandardItem('...loading...')
+                self._model.setVerticalHeaderItem(row_number, vert_header_item)
+            self._model.blockSignals(False)
+            if not done:
+                self.n_incomplete += len(to_add)
+            self._model.dataChanged.emit(self._model.index(first_new_row, self.COL_STATUS),
+                                         self._model.index(last_new_row, self.COL_FILEPATH))
+            self._model.headerDataChanged.emit(QtCore.Qt.Vertical, first_new_row, last_new_row)
+            # All rows are the same height, so only one needs to be measured:
+            self._view.resizeRowToContents(first_new_row)
+            row_height = self._view.rowHeight(first_new_row)
+            for row_number in range(first_new_row + 1, last_new_row + 1):
+                self._view.setRowHeight(row_number, row_height)
 
         self.renumber_rows(add_from=self._model.rowCount()-len(to_add))
 
-        # Update the Qt model:
-        for filepath in to_add:
-            self.update_row(filepath, dataframe_already_updated=True)
+        if to_add:
+            # Update the Qt model for all the new rows at once:
+            self.update_model(first_new_row, last_new_row)
 
         app.filebox.set_add_shots_progress(None, None, None)        
             
@@ -1618,15 +1995,24 @@ class DataFrameModel(QtCore.QObject):
     def get_first_incomplete(self):
         """Returns the filepath of the first shot in the model that has not
         been analysed"""
-        for row in range(self._model.rowCount()):
+        # Rows are usually analysed in order, so start looking from where we found
+        # the first incomplete row last time, rather than from the top. Rows
+        # appended since then are after this point, and anything that marks an
+        # earlier row as incomplete moves it back:
+        for row in range(self._first_incomplete_row, self._model.rowCount()):
             status_item = self._model.item(row, self.COL_STATUS)
             if status_item.data(self.ROLE_STATUS_PERCENT) != 100:
-                filepath_item = self._model.item(row, self.COL_FILEPATH)
-                return filepath_item.text()
+                self._first_incomplete_row = row
+                return self.filepath_by_row[row]
+        self._first_incomplete_row = self._model.rowCount()
         
         
 class FileBox(object):
 
+    # Minimum time between updates of the add shots progress bar whilst reading
+    # shot files, in seconds:
+    PROGRESS_UPDATE_INTERVAL = 0.05
+
     def __init__(self, container, exp_config, to_singleshot, from_singleshot, to_multishot, from_multishot):
 
         self.exp_config = exp_config
@@ -1666,6 +2052,14 @@ class FileBox(object):
         # or paused:
         self.incoming_queue = queue.Queue()
 
+        # Threads for reading shot files. Much of the time spent opening each file
+        # is waiting on locks and the filesystem, so this overlaps that waiting for
+        # a batch of files. HDF5 errors are silenced in these threads too, see
+        # incoming_buffer_loop():
+        self.shot_reader_pool = ThreadPoolExecutor(
+            max_workers=4, initializer=h5py._errors.silence_errors
+        )
+
         # Start the thread to handle incoming files, and store them in
         # a buffer if processing is paused:
         self.incoming = threading.Thread(target=self.incoming_buffer_loop)
@@ -1767,25 +2161,25 @@ class FileBox(object):
         # imported. So we'll silence them in this thread too:
         h5py._errors.silence_errors()
         n_shots_added = 0
+        last_progress_update = 0
         while True:
             try:
                 filepaths = []
                 filepath = self.incoming_queue.get()
                 filepaths.append(filepath)
-                if self.incoming_queue.qsize() == 0:
-                    # Wait momentarily in case more arrive so we can batch process them:
-                    time.sleep(0.1)
                 # Batch process to decrease number of dataframe concatenations:
                 batch_size = len(self.shots_model.dataframe) // 3 + 1 
-                while True:
+                # Wait momentarily in case more arrive so we can batch process them,
+                # but no longer than it takes to fill the batch:
+                deadline = time.monotonic() + 0.1
+                while len(filepaths) < batch_size:
                     try:
-                        filepath = self.incoming_queue.get(False)
+                        timeout = max(0, deadline - time.monotonic())
+                        filepath = self.incoming_queue.get(timeout=timeout)
                     except queue.Empty:
                         break
                     else:
                         filepaths.append(filepath)
-                        if len(filepaths) >= batch_size:
-                            break
                 logger.info('adding:\n%s' % '\n'.join(filepaths))
                 if n_shots_added == 0:
                     total_shots = self.incoming_queue.qsize() + len(filepaths)
@@ -1793,13 +2187,15 @@ class FileBox(object):
 
                 # Remove duplicates from the list (preserving order) in case the
                 # client sent the same filepath multiple times:
-                filepaths = sorted(set(filepaths), key=filepaths.index) # Inefficient but readable
+                filepaths = list(dict.fromkeys(filepaths))
                 # We open the HDF5 files here outside the GUI thread so as not to hang the GUI:
                 dataframes = []
                 indices_of_files_not_found = []
-                for i, filepath in enumerate(filepaths):
+                futures = [self.shot_reader_pool.submit(get_dataframe_from_shot, filepath)
+                           for filepath in filepaths]
+                for i, (filepath, future) in enumerate(zip(filepaths, futures)):
                     try:
-                        dataframe = get_dataframe_from_shot(filepath)
+                        dataframe = future.result()
                         dataframes.append(dataframe)
                     except IOError:
                         app.output_box.output('Warning: Ignoring shot file not found or not readable %s\n' % filepath, red=True)
@@ -1807,7 +2203,12 @@ class FileBox(object):
                     n_shots_added += 1
                     shots_remaining = self.incoming_queue.qsize()
                     total_shots = n_shots_added + shots_remaining + len(filepaths) - (i + 1)
-                    self.set_add_shots_progress(n_shots_added, total_shots, "reading shot files")
+                    # Updating the progress bar waits on the main thread, so don't do it
+                    # more often than it can usefully be seen. The progress bar is
+                    # updated again once all files in the batch are read:
+                    if time.monotonic() - last_progress_update > self.PROGRESS_UPDATE_INTERVAL:
+                        self.set_add_shots_progress(n_shots_added, total_shots, "reading shot files")
+                        last_progress_update = time.monotonic()
                 self.set_add_shots_progress(n_shots_added, total_shots, "concatenating dataframes")
                 if dataframes:
                     new_row_data = concat_with_padding(*dataframes)
@@ -1843,6 +2244,9 @@ class FileBox(object):
             try:
                 self.analysis_pending.wait()
                 self.analysis_pending.clear()
+                if not self.shots_model.n_incomplete and not self.multishot_required:
+                    # Nothing to do, don't bother looking for shots to analyse:
+                    continue
                 at_least_one_shot_analysed = False
                 while True:
                     if not self.analysis_paused:
@@ -1939,6 +2343,9 @@ class Lyse(object):
         loader = UiLoader()
         self.ui = loader.load(os.path.join(LYSE_DIR, 'main.ui'), LyseMainWindow())
 
+        # Cached result of get_screen_geometry(), reset when screens change:
+        self._screen_geometry = None
+
         self.connect_signals()
 
         self.setup_config()
@@ -1954,10 +2361,11 @@ class Lyse(object):
         from_multishot = queue.Queue()
 
         self.output_box = OutputBox(self.ui.verticalLayout_output_box)
+        self.worker_pool = WorkerPool(self.output_box.port)
         self.singleshot_routinebox = RoutineBox(self.ui.verticalLayout_singleshot_routinebox, self.exp_config,
-                                                self, to_singleshot, from_singleshot, self.output_box.port)
+                                                self, to_singleshot, from_singleshot, self.worker_pool)
         self.multishot_routinebox = RoutineBox(self.ui.verticalLayout_multishot_routinebox, self.exp_config,
-                                               self, to_multishot, from_multishot, self.output_box.port, multishot=True)
+                                               self, to_multishot, from_multishot, self.worker_pool, multishot=True)
         self.filebox = FileBox(self.ui.verticalLayout_filebox, self.exp_config,
                                to_singleshot, from_singleshot, to_multishot, from_multishot)
 
@@ -2015,6 +2423,7 @@ class Lyse(object):
         # self.ui.showMaximized()
 
     def terminate_all_workers(self):
+        self.worker_pool.shutdown()
         for routine in self.singleshot_routinebox.routines + self.multishot_routinebox.routines:
             routine.end_child()
 
@@ -2125,7 +2534,7 @@ class Lyse(object):
 
         save_data['window_pos'] = (window_pos.x(), window_pos.y())
 
-        save_data['screen_geometry'] = get_screen_geometry()
+        save_data['screen_geometry'] = self.get_screen_geometry()
         save_data['splitter'] = self.ui.splitter.sizes()
         save_data['splitter_vertical'] = self.ui.splitter_vertical.sizes()
         save_data['splitter_horizontal'] = self.ui.splitter_horizontal.sizes()
@@ -2208,7 +2617,7 @@ class Lyse(object):
         # position was saved when 2 monitors were plugged in but there is
         # only one now, and the splitters may not make sense in light of a
         # different window size, so better to fall back to defaults:
-        current_screen_geometry = get_screen_geometry()
+        current_screen_geometry = self.get_screen_geometry()
         if current_screen_geometry == screen_geometry:
             if 'window_size' in save_data:
                 self.ui.resize(*save_data['window_size'])
@@ -2238,9 +2647,31 @@ class Lyse(object):
         # Keyboard shortcuts:
         QtWidgets.QShortcut('Del', self.ui, lambda: self.delete_items(True))
         QtWidgets.QShortcut('Shift+Del', self.ui, lambda: self.delete_items(False))
+        # Invalidate the cached screen geometry if the screens change:
+        qapplication.screenAdded.connect(self.on_screen_added)
+        qapplication.screenRemoved.connect(self.on_screens_changed)
+        for screen in qapplication.screens():
+            screen.geometryChanged.connect(self.on_screens_changed)
+
+    def on_screen_added(self, screen):
+        screen.geometryChanged.connect(self.on_screens_changed)
+        self.on_screens_changed()
+
+    def on_screens_changed(self, *args):
+        self._screen_geometry = None
+
+    def get_screen_geometry(self):
+        """Return get_screen_geometry(), computing it only if the screens have
+        changed since it was last called"""
+        if self._screen_geometry is None:
+            self._screen_geometry = get_screen_geometry()
+        return self._screen_geometry
 
     def on_save_dataframe_triggered(self, choose_folder=True):
-        df = self.filebox.shots_model.dataframe.copy()
+        # No copy needed: the dataframe is only modified in the main thread,
+        # which is blocked here until saving is done, and every sequence is
+        # split off into its own dataframe before anything is modified.
+        df = self.filebox.shots_model.dataframe
         if len(df) > 0:
             default = self.exp_config.get('paths', 'experiment_shot_storage')
             if choose_folder:
@@ -2250,27 +2681,78 @@ class Lyse(object):
                 if not save_path:
                     # User cancelled
                     return
-            sequences = df.sequence.unique()
-            for sequence in sequences:
-                sequence_df = pandas.DataFrame(df[df['sequence'] == sequence], columns=df.columns).dropna(axis=1, how='all')
+            try:
+                file_format = self.exp_config.get('lyse', 'dataframe_file_format')
+            except (LabConfig.NoOptionError, LabConfig.NoSectionError):
+                file_format = 'pkl'
+            if file_format not in ('pkl', 'parquet'):
+                error_dialog("Invalid value '%s' for [lyse] dataframe_file_format in labconfig, "
+                             "must be 'pkl' or 'parquet'" % file_format)
+                return
+
+            def save_sequence(group):
+                sequence, sequence_df = group
+                sequence_df = sequence_df.dropna(axis=1, how='all')
                 labscript = sequence_df['labscript'].iloc[0]
-                filename = "dataframe_{}_{}.pkl".format(sequence.to_pydatetime().strftime("%Y%m%dT%H%M%S"),labscript[:-3])
-                if not choose_folder:
-                    save_path = os.path.dirname(sequence_df['filepath'].iloc[0])
-                sequence_df.infer_objects()
-                for col in sequence_df.columns :
-                    if sequence_df[col].dtype == object:
-                        sequence_df[col] = pandas.to_numeric(sequence_df[col], errors='ignore')
-                sequence_df.to_pickle(os.path.join(save_path, filename))
+                filename = "dataframe_{}_{}".format(sequence.strftime("%Y%m%dT%H%M%S"), labscript[:-3])
+                if choose_folder:
+                    sequence_save_path = save_path
+                else:
+                    sequence_save_path = os.path.dirname(sequence_df['filepath'].iloc[0])
+                sequence_df = sequence_df.infer_objects()
+                for col in sequence_df.select_dtypes(include=object).columns:
+                    # to_numeric gives up on the whole column at the first value
+                    # it can't parse, so only try it if a sample of the values
+                    # all look like numbers:
+                    sample = sequence_df[col].dropna().head(16).astype(str)
+                    if not sample.str.match(r'\s*[+-]?(\d|\.\d|inf|nan)', case=False).all():
+                        continue
+                    sequence_df[col] = pandas.to_numeric(sequence_df[col], errors='ignore')
+                self.write_dataframe(sequence_df, os.path.join(sequence_save_path, filename), file_format)
+
+            # Sequences are saved to separate files, so write them in parallel
+            # to overlap one sequence's file I/O with preparing the next. Any
+            # exception raised while saving is re-raised here by list().
+            groups = []
+            for sequence, sequence_df in df.groupby(df['sequence'], sort=False, dropna=False):
+                if pandas.isna(sequence):
+                    # Files are named after their sequence, so shots without one
+                    # can't be saved:
+                    self.output_box.output('Warning: Not saving %d shots with no sequence\n' % len(sequence_df),
+                                           red=True)
+                else:
+                    groups.append((sequence, sequence_df))
+            if not groups:
+                error_dialog('No shots with a sequence to save')
+                return
+            with ThreadPoolExecutor(max_workers=min(8, len(groups))) as executor:
+                list(executor.map(save_sequence, groups))
         else:
             error_dialog('Dataframe is empty')
 
+    def write_dataframe(self, df, path_without_extension, file_format):
+        """Write df to path_without_extension plus the extension for file_format
+        ('pkl' or 'parquet'). Parquet needs pyarrow and can't hold arbitrary
+        Python objects, so if writing it fails the dataframe is pickled
+        instead."""
+        if file_format == 'parquet':
+            path = path_without_extension + '.parquet'
+            try:
+                df.to_parquet(path, compression='zstd')
+                return
+            except (ImportError, ValueError, TypeError, NotImplementedError) as e:
+                if os.path.exists(path):
+                    os.remove(path)
+                self.output_box.output('Warning: Could not save %s.parquet (%s: %s), saving it as a pickle instead\n' %
+                                       (path_without_extension, e.__class__.__name__, str(e)), red=True)
+        df.to_pickle(path_without_extension + '.pkl')
+
     def on_load_dataframe_triggered(self):
         default = os.path.join(self.exp_config.get('paths', 'experiment_shot_storage'), 'dataframe.pkl')
         file = QtWidgets.QFileDialog.getOpenFileName(self.ui,
                         'Select dataframe file to load',
                         default,
-                        "dataframe files (*.pkl *.msg)")
+                        "dataframe files (*.pkl *.parquet *.feather *.msg)")
         if type(file) is tuple:
             file, _ = file
         if not file:
@@ -2293,26 +2775,45 @@ class Lyse(object):
                 To read this dataframe, you must downgrade pandas to < 1.0.0.
                 You can then read this dataframe and resave it with the new format."""
                 raise DeprecationWarning(dedent(msg)) from err
+        elif file.endswith('.parquet'):
+            df = pandas.read_parquet(file).sort_values("run time").reset_index()
+        elif file.endswith('.feather'):
+            df = pandas.read_feather(file).sort_values("run time").reset_index()
         else:
             df = pandas.read_pickle(file).sort_values("run time").reset_index()
                 
-        # Check for changes in the shot files since the dataframe was exported
-        def changed_since(filepath, time):
-            if os.path.isfile(filepath):
-                return os.path.getmtime(filepath) > time
-            else:
-                return False
-
+        # Check for changes in the shot files since the dataframe was exported.
+        # Shots are grouped by folder so that each folder is listed once with
+        # os.scandir, and only the shot files in it are stat'ed. Names are
+        # compared with normcase for case-insensitive filesystems, and shots not
+        # found in the listing are checked individually. Shots no longer on disk
+        # get an mtime of -1 and are never reloaded.
         filepaths = df["filepath"].tolist()
         changetime_cache = os.path.getmtime(file)
-        need_updating = np.where(list(map(lambda x: changed_since(x, changetime_cache), filepaths)))[0]
-        need_updating = np.sort(need_updating)[::-1]  # sort in descending order to not remove the wrong items with pop
+        indices_by_folder = defaultdict(list)
+        for i, filepath in enumerate(filepaths):
+            indices_by_folder[os.path.dirname(filepath)].append(i)
+        mtimes = np.full(len(filepaths), -1.0)
+        for folder, indices in indices_by_folder.items():
+            index_by_name = {os.path.normcase(os.path.basename(filepaths[i])): i for i in indices}
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        i = index_by_name.pop(os.path.normcase(entry.name), None)
+                        if i is not None and entry.is_file():
+                            mtimes[i] = entry.stat().st_mtime
+            except OSError:
+                pass
+            for i in index_by_name.values():
+                if os.path.isfile(filepaths[i]):
+                    mtimes[i] = os.path.getmtime(filepaths[i])
+        need_updating = mtimes > changetime_cache
 
         # Reload the files where changes where made since exporting
-        for index in need_updating:
-            filepath = filepaths.pop(index)
+        for filepath in np.array(filepaths, dtype=object)[need_updating]:
             self.filebox.incoming_queue.put(filepath)
-        df = df.drop(need_updating)
+        df = df.iloc[~need_updating]
+        filepaths = [filepath for filepath, changed in zip(filepaths, need_updating) if not changed]
         
         self.filebox.shots_model.add_files(filepaths, df, done=True)
 
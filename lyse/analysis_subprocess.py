@@ -19,6 +19,9 @@ import os
 import threading
 import traceback
 import time
+import atexit
+import warnings
+import builtins
 from types import ModuleType
 
 from qtutils.qt import QtCore, QtGui, QtWidgets
@@ -30,6 +33,8 @@ import qtutils.icons
 
 import multiprocessing
 
+import numpy as np
+
 # Associate app windows with OS menu shortcuts:
 import desktop_app
 desktop_app.set_process_appid('lyse')
@@ -42,6 +47,86 @@ if (
     multiprocessing.set_start_method('spawn')
 
 
+# numpy scalar dtypes whose equivalent Python builtin type is stored in the
+# dataframe with the same dtype again:
+_ROUND_TRIP_DTYPES = (np.dtype(np.float64), np.dtype(np.int64), np.dtype(np.bool_), np.dtype(np.complex128))
+
+
+def compact_updated_data(updated_data):
+    """Return a copy of the results dict to be sent to the parent process, with
+    numpy scalars converted to the equivalent Python builtin types. These are
+    several times smaller and faster to pickle, and results saved with
+    Run.save_result() are frequently numpy scalars. Only float64, int64, bool
+    and complex128 scalars are converted, since other types such as float32 or
+    uint64 would not come back as the same dtype in the dataframe."""
+    compact = {}
+    for filepath, results in updated_data.items():
+        compact_results = {}
+        for key, value in results.items():
+            if isinstance(value, np.generic) and value.dtype in _ROUND_TRIP_DTYPES:
+                value = value.item()
+            compact_results[key] = value
+        compact[filepath] = compact_results
+    return compact
+
+
+class OutputBuffer(object):
+    """Collects text written to stdout and stderr, and forwards it to the
+    underlying streams in batches from a background thread. Each write to the
+    redirected streams is sent as a separate message to the output box of the
+    parent process, so this turns many small writes from chatty analysis
+    routines into a few larger ones. Ordering between stdout and stderr is
+    preserved."""
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.chunks = []
+        self.flush_thread = threading.Thread(target=self.flush_loop)
+        self.flush_thread.daemon = True
+        self.flush_thread.start()
+
+    def write(self, stream, text):
+        with self.lock:
+            self.chunks.append((stream, text))
+
+    def flush(self):
+        with self.lock:
+            chunks = self.chunks
+            self.chunks = []
+            # Merge consecutive writes to the same stream:
+            merged = []
+            for stream, text in chunks:
+                if merged and merged[-1][0] is stream:
+                    merged[-1][1].append(text)
+                else:
+                    merged.append((stream, [text]))
+            for stream, texts in merged:
+                stream.write(''.join(texts))
+                stream.flush()
+
+    def flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+class BufferedWriter(object):
+    """A file-like object that writes to a stream via an OutputBuffer"""
+    def __init__(self, output_buffer, stream):
+        self.output_buffer = output_buffer
+        self.stream = stream
+
+    def write(self, text):
+        self.output_buffer.write(self.stream, text)
+        return len(text)
+
+    def flush(self):
+        self.output_buffer.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
 class PlotWindowCloseEvent(QtGui.QCloseEvent):
     def __init__(self, force, *args, **kwargs):
         QtGui.QCloseEvent.__init__(self, *args, **kwargs)
@@ -96,6 +181,15 @@ class Plot(object):
         self.lock_axes = False
         self.axis_limits = None
 
+        # Cached backgrounds of each axes (excluding data artists) for blitting,
+        # and the layout they were captured with:
+        self._bg = None
+        self._bg_signature = None
+        self._resize_cid = self.canvas.mpl_connect('resize_event', self._invalidate_background)
+
+        # The figure size and dpi that the window was last sized for:
+        self._last_size = None
+
         self.update_window_size()
 
         self.ui.show()
@@ -113,26 +207,91 @@ class Plot(object):
 
     @inmain_decorator()
     def save_axis_limits(self):
-        axis_limits = {}
-        for i, ax in enumerate(self.figure.axes):
-            # Save the limits of the axes to restore them afterward:
-            axis_limits[i] = ax.get_xlim(), ax.get_ylim()
-
-        self.axis_limits = axis_limits
+        # Save the limits of the axes to restore them afterward, in order of
+        # the axes' index in the figure:
+        self.axis_limits = [(ax.get_xlim(), ax.get_ylim()) for ax in self.figure.axes]
 
     @inmain_decorator()
     def clear(self):
         self.figure.clear()
 
+    def _invalidate_background(self, event=None):
+        self._bg = None
+        self._bg_signature = None
+
+    def _get_dynamic_artists(self, ax):
+        artists = [*ax.lines, *ax.collections, *ax.patches, *ax.images, *ax.texts,
+                   *ax.artists, *ax.tables]
+        legend = ax.get_legend()
+        if legend is not None:
+            artists.append(legend)
+        return sorted(artists, key=lambda artist: artist.get_zorder())
+
+    def _get_background_signature(self):
+        # Everything that the static parts of each axes (frame, ticks, labels)
+        # depend on. If this is unchanged, a previously captured background
+        # can be reused even though the axes themselves are new objects:
+        return [
+            (
+                tuple(ax.bbox.bounds),
+                ax.get_xlim(),
+                ax.get_ylim(),
+                ax.get_title('left'),
+                ax.get_title('center'),
+                ax.get_title('right'),
+                ax.get_xlabel(),
+                ax.get_ylabel(),
+                tuple(label.get_text() for label in ax.get_xticklabels()),
+                tuple(label.get_text() for label in ax.get_yticklabels()),
+                ax.get_xscale(),
+                ax.get_yscale(),
+                any(line.get_visible() for line in ax.get_xgridlines()),
+                any(line.get_visible() for line in ax.get_ygridlines()),
+                tuple(ax.get_facecolor()),
+                tuple((name, spine.get_visible()) for name, spine in ax.spines.items()),
+            )
+            for ax in self.figure.axes
+        ]
+
+    def _has_figure_artists(self):
+        # Artists belonging to the figure rather than to any axes, such as a
+        # suptitle or figure legend, lie outside the blitted regions:
+        figure = self.figure
+        return bool(figure.texts or figure.legends or figure.artists or figure.lines
+                    or figure.patches or figure.images)
+
+    def _has_layout_engine(self):
+        # Layout engines only move the axes during a full draw, so the positions
+        # of new axes can't be compared with those of a captured background:
+        get_layout_engine = getattr(self.figure, 'get_layout_engine', None)
+        if get_layout_engine is not None:
+            # matplotlib >= 3.6:
+            return get_layout_engine() is not None
+        return self.figure.get_tight_layout() or self.figure.get_constrained_layout()
+
+    def _has_legends_outside_axes(self):
+        # Legends placed outside their axes, e.g. with bbox_to_anchor, lie
+        # outside the blitted regions:
+        renderer = self.canvas.get_renderer()
+        for ax in self.figure.axes:
+            legend = ax.get_legend()
+            if legend is not None:
+                extent = legend.get_window_extent(renderer)
+                if (extent.x0 < ax.bbox.x0 or extent.y0 < ax.bbox.y0
+                        or extent.x1 > ax.bbox.x1 or extent.y1 > ax.bbox.y1):
+                    return True
+        return False
+
     @inmain_decorator()
     def restore_axis_limits(self):
-        for i, ax in enumerate(self.figure.axes):
-            try:
-                xlim, ylim = self.axis_limits[i]
-                ax.set_xlim(xlim)
-                ax.set_ylim(ylim)
-            except KeyError:
-                continue
+        # Any axes beyond those whose limits were saved are left alone:
+        for ax, (xlim, ylim) in zip(self.figure.axes, self.axis_limits):
+            if ax.get_xlim() == tuple(xlim) and ax.get_ylim() == tuple(ylim):
+                # Already correct (common when the script plots the same data
+                # ranges each run). Just ensure later autoscaling can't change them:
+                ax.set_autoscale_on(False)
+            else:
+                ax.set(xlim=xlim, ylim=ylim)
 
     @inmain_decorator()
     def set_window_title(self, identifier, filepath):
@@ -142,12 +301,97 @@ class Plot(object):
     def update_window_size(self):
         l, w = self.figure.get_size_inches()
         dpi = self.figure.get_dpi()
+        # Resizing triggers a relayout of the window and a redraw, so skip it if
+        # nothing has changed:
+        size = (l, w, dpi)
+        if size == self._last_size:
+            return
+        self._last_size = size
         self.canvas.resize(int(l*dpi),int(w*dpi))
         self.ui.adjustSize()
 
     @inmain_decorator()
     def draw(self):
-        self.canvas.draw()
+        # Schedule a redraw rather than drawing synchronously, so that multiple
+        # requests before the next event loop iteration result in a single draw:
+        self.canvas.draw_idle()
+
+    @inmain_decorator()
+    def blit_draw(self):
+        """Redraw only the data artists of each axes on top of a cached
+        background, falling back to a full draw if the background is not
+        available, the layout of the axes has changed, or the figure has
+        artists outside of its axes or a layout engine."""
+        if self._has_figure_artists() or self._has_layout_engine():
+            self._invalidate_background()
+            self.canvas.draw_idle()
+            return
+        dynamic_artists = [self._get_dynamic_artists(ax) for ax in self.figure.axes]
+        if (
+            self._bg is not None
+            and self._get_background_signature() == self._bg_signature
+            and not self._has_legends_outside_axes()
+        ):
+            for ax, background, artists in zip(self.figure.axes, self._bg, dynamic_artists):
+                self.canvas.restore_region(background)
+                for artist in artists:
+                    ax.draw_artist(artist)
+                self.canvas.blit(ax.bbox)
+            return
+
+        # Draw everything but the data artists, and capture the result as the
+        # background for subsequent blits:
+        for artists in dynamic_artists:
+            for artist in artists:
+                artist.set_animated(True)
+        try:
+            self.canvas.draw()
+            self._bg = [self.canvas.copy_from_bbox(ax.bbox) for ax in self.figure.axes]
+            # Taken after drawing, so that it describes the background as drawn:
+            self._bg_signature = self._get_background_signature()
+            for ax, artists in zip(self.figure.axes, dynamic_artists):
+                for artist in artists:
+                    ax.draw_artist(artist)
+        finally:
+            for artists in dynamic_artists:
+                for artist in artists:
+                    artist.set_animated(False)
+        self.canvas.blit(self.figure.bbox)
+
+    @inmain_decorator()
+    def prepare_for_analysis(self):
+        """Save the axis limits and clear the figure prior to the analysis
+        routine running, in a single call to the main thread. The figure's
+        stale callback is suspended meanwhile, so that clearing it does not
+        schedule a redraw of the empty figure."""
+        stale_callback = self.figure.stale_callback
+        self.figure.stale_callback = None
+        try:
+            self.save_axis_limits()
+            self.clear()
+        finally:
+            self.figure.stale_callback = stale_callback
+
+    @inmain_decorator()
+    def apply_post_analysis(self, identifier, filepath, figure_in_use=True):
+        """Update the window and redraw the figure after the analysis routine
+        has run, in a single call to the main thread"""
+        if not figure_in_use:
+            self.set_window_title("Empty", filepath)
+            self.draw()
+        else:
+            if not self.is_shown:
+                self.show()
+                self.update_window_size()
+            self.set_window_title(identifier, filepath)
+            if self.lock_axes:
+                self.restore_axis_limits()
+                # Axes limits are unchanged from the previous run, so only
+                # the data needs redrawing:
+                self.blit_draw()
+            else:
+                self.draw()
+        self.analysis_complete(figure_in_use=figure_in_use)
 
     def show(self):
         self.ui.show()
@@ -210,6 +454,9 @@ class Plot(object):
                 self.lock_action.trigger()
 
                 if axis_limits is not None:
+                    if isinstance(axis_limits, dict):
+                        # Saved by an older version, keyed by axes index:
+                        axis_limits = [axis_limits[i] for i in sorted(axis_limits)]
                     self.axis_limits = axis_limits
                     self.restore_axis_limits()
 
@@ -223,10 +470,15 @@ class Plot(object):
         # that is associated with the figure canvas (which is reused in the new
         # plot window) and this must be released before closing the window or else
         # it is held forever
-        self.navigation_toolbar.pan()
-        self.navigation_toolbar.zoom()
-        self.navigation_toolbar.pan()
-        self.navigation_toolbar.pan()
+        self.canvas.mpl_disconnect(self._resize_cid)
+        toolbar = self.navigation_toolbar
+        # Calling the method of the active mode toggles it off, releasing the lock:
+        if toolbar.mode == 'pan/zoom':
+            toolbar.pan()
+        elif toolbar.mode == 'zoom rect':
+            toolbar.zoom()
+        if self.canvas.widgetlock.isowner(toolbar):
+            self.canvas.widgetlock.release(toolbar)
 
 
 class AnalysisWorker(object):
@@ -242,10 +494,23 @@ class AnalysisWorker(object):
         # __main__ module:
         self.routine_module = ModuleType('__main__')
         self.routine_module.__file__ = self.filepath
+        # exec() would otherwise insert this on every run:
+        self.routine_module.__builtins__ = builtins
+        # Optionally make commonly used modules available to the routine without
+        # it needing to import them:
+        if self.get_prepopulate_namespace():
+            import matplotlib.pyplot
+            self.routine_module.np = np
+            self.routine_module.plt = matplotlib.pyplot
+            self.routine_module.lyse = lyse
         # Save the dict so we can reset the module to a clean state later:
         self.routine_module_clean_dict = self.routine_module.__dict__.copy()
         sys.modules[self.routine_module.__name__] = self.routine_module
 
+        # The compiled code of the user's routine, and the modification time
+        # and size of the file it was compiled from:
+        self._code_cache = (None, None)
+
         # Plot objects, keyed by matplotlib Figure object:
         self.plots = {}
 
@@ -259,6 +524,29 @@ class AnalysisWorker(object):
         self.mainloop_thread.daemon = True
         self.mainloop_thread.start()
         
+    def get_prepopulate_namespace(self):
+        """Whether the labconfig enables pre-populating the namespace of analysis
+        routines with numpy as np, matplotlib.pyplot as plt, and lyse"""
+        try:
+            # Reuse the labconfig that importing lyse already parsed, unless it
+            # has been edited since. Spare workers import lyse when they start,
+            # possibly long before they are given an analysis routine:
+            exp_config = lyse._labconfig
+            try:
+                if exp_config is not None and os.path.getmtime(exp_config.config_path) != lyse._labconfig_mtime:
+                    exp_config = None
+            except OSError:
+                exp_config = None
+            if exp_config is None:
+                exp_config = LabConfig()
+            return exp_config.getboolean('lyse', 'prepopulate_namespace')
+        except (LabConfig.NoOptionError, LabConfig.NoSectionError):
+            return False
+        except ValueError as e:
+            warnings.warn("Invalid value for [lyse] prepopulate_namespace in labconfig, "
+                          "not pre-populating namespace: %s" % str(e))
+            return False
+
     def mainloop(self):
         # HDF5 prints lots of errors by default, for things that aren't
         # actually errors. These are silenced on a per thread basis,
@@ -267,20 +555,22 @@ class AnalysisWorker(object):
         h5py._errors.silence_errors()
         while True:
             task, data = self.from_parent.get()
-            with kill_lock:
-                if task == 'quit':
-                    inmain(qapplication.quit)
-                elif task == 'analyse':
-                    path = data
+            if task == 'quit':
+                inmain(qapplication.quit)
+            elif task == 'analyse':
+                path = data
+                # Only running the analysis and replying with its results need
+                # protecting from being killed part way through:
+                with kill_lock:
                     success = self.do_analysis(path)
                     if success:
                         if lyse._delay_flag:
                             lyse.delay_event.wait()
-                        self.to_parent.put(['done', lyse._updated_data])
+                        self.to_parent.put(['done', compact_updated_data(lyse._updated_data)])
                     else:
-                        self.to_parent.put(['error', lyse._updated_data])
-                else:
-                    self.to_parent.put(['error','invalid task %s'%str(task)])
+                        self.to_parent.put(['error', compact_updated_data(lyse._updated_data)])
+            else:
+                self.to_parent.put(['error','invalid task %s'%str(task)])
         
     @inmain_decorator()
     def do_analysis(self, path):
@@ -292,9 +582,13 @@ class AnalysisWorker(object):
 
         self.pre_analysis_plot_actions()
 
-        # Reset the routine module's namespace:
-        self.routine_module.__dict__.clear()
-        self.routine_module.__dict__.update(self.routine_module_clean_dict)
+        # Reset the routine module's namespace. Only the names added by the previous
+        # run are deleted, rather than clearing the dict, so that it does not have to
+        # be resized repeatedly as the namespace is repopulated during this run:
+        namespace = self.routine_module.__dict__
+        for name in [name for name in namespace if name not in self.routine_module_clean_dict]:
+            del namespace[name]
+        namespace.update(self.routine_module_clean_dict)
 
         # Use lyse.path instead:
         lyse.path = path
@@ -313,14 +607,8 @@ class AnalysisWorker(object):
         try:
             with self.modulewatcher.lock:
                 # Actually run the user's analysis!
-                with open(self.filepath) as f:
-                    code = compile(
-                        f.read(),
-                        self.routine_module.__file__,
-                        'exec',
-                        dont_inherit=True,
-                    )
-                    exec(code, self.routine_module.__dict__)
+                code = self.get_code()
+                exec(code, self.routine_module.__dict__)
         except Exception:
             traceback_lines = traceback.format_exception(*sys.exc_info())
             print('\n'.join(traceback_lines[1:]), file=sys.stderr)
@@ -331,12 +619,30 @@ class AnalysisWorker(object):
             os.chdir(cwd)
             print('')
             self.post_analysis_plot_actions()
+            # Ensure all output from this run is sent before results are returned:
+            sys.stdout.flush()
         
+    def get_code(self):
+        """Return the compiled code of the user's routine, only reading and
+        compiling the file again if it has changed since it was last compiled"""
+        stat = os.stat(self.filepath)
+        file_version = (stat.st_mtime_ns, stat.st_size)
+        cached_version, code = self._code_cache
+        if file_version != cached_version:
+            with open(self.filepath) as f:
+                code = compile(
+                    f.read(),
+                    self.routine_module.__file__,
+                    'exec',
+                    dont_inherit=True,
+                )
+            self._code_cache = (file_version, code)
+        return code
+
     def pre_analysis_plot_actions(self):
         lyse.figure_manager.figuremanager.reset()
         for plot in self.plots.values():
-            plot.save_axis_limits()
-            plot.clear()
+            plot.prepare_for_analysis()
 
     def post_analysis_plot_actions(self):
         # reset the current figure to figure 1:
@@ -344,21 +650,15 @@ class AnalysisWorker(object):
         # Introspect the figures that were produced:
         for identifier, fig in lyse.figure_manager.figuremanager.figs.items():
             window_state = None
+            plot = self.plots.get(fig)
             if not fig.axes:
                 # Try and clear the figure if it is not in use
-                try:
-                    plot = self.plots[fig]
-                    plot.set_window_title("Empty", self.filepath)
-                    plot.draw()
-                    plot.analysis_complete(figure_in_use=False)
-                except KeyError:
-                    pass
+                if plot is not None:
+                    plot.apply_post_analysis(identifier, self.filepath, figure_in_use=False)
                 # Skip the rest of the loop regardless of whether we managed to clear
                 # the unused figure or not!
                 continue
-            try:
-                plot = self.plots[fig]
-
+            if plot is not None:
                 # Get the Plot subclass registered for this plot identifier if it exists
                 cls = lyse.get_plot_class(identifier)
                 # If no plot was registered, use the base class
@@ -373,13 +673,11 @@ class AnalysisWorker(object):
                     # Create a custom CloseEvent to force close the plot window
                     event = PlotWindowCloseEvent(True)
                     QtCore.QCoreApplication.instance().postEvent(plot.ui, event)
-                    # Delete the plot
+                    # Delete the plot so that the window is recreated below
                     del self.plots[fig]
+                    plot = None
 
-                    # force raise the keyerror exception to recreate the window
-                    self.plots[fig]
-
-            except KeyError:
+            if plot is None:
                 # If we don't already have this figure, make a window
                 # to put it in:
                 plot = self.new_figure(fig, identifier)
@@ -387,15 +685,9 @@ class AnalysisWorker(object):
                 # restore window state/geometry if it was saved
                 if window_state is not None:
                     plot.restore_window_state(window_state)
+                plot.analysis_complete(figure_in_use=True)
             else:
-                if not plot.is_shown:
-                    plot.show()
-                    plot.update_window_size()
-                plot.set_window_title(identifier, self.filepath)
-                if plot.lock_axes:
-                    plot.restore_axis_limits()
-                plot.draw()
-            plot.analysis_complete(figure_in_use=True)
+                plot.apply_post_analysis(identifier, self.filepath)
 
 
     def new_figure(self, fig, identifier):
@@ -431,6 +723,31 @@ class AnalysisWorker(object):
         
 if __name__ == '__main__':
 
+    # Connect to the parent before the slow imports below, so that the parent
+    # is not kept waiting for the handshake whilst they happen. They are still
+    # done before we wait to be told which analysis routine to run, so that a
+    # spare worker is ready to go as soon as it is given one:
+    process_tree = ProcessTree.connect_to_parent()
+    to_parent = process_tree.to_parent
+    from_parent = process_tree.from_parent
+    kill_lock = process_tree.kill_lock
+
+    # zprocess pickles messages with protocol 4 by default. We and the parent are
+    # always the same interpreter, so use the highest protocol (5), with which
+    # numpy arrays in results are pickled with a single copy of their data
+    # buffers rather than via intermediate bytes objects. This is a zprocess
+    # module global, so it applies to every message this worker sends or
+    # receives through zprocess, not only results. That is fine, as all of
+    # them go to or come from the same interpreter:
+    import pickle
+    import zprocess
+    zprocess.PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+    output_buffer = OutputBuffer()
+    sys.stdout = BufferedWriter(output_buffer, sys.stdout)
+    sys.stderr = BufferedWriter(output_buffer, sys.stderr)
+    atexit.register(output_buffer.flush)
+
     os.environ['MPLBACKEND'] = "qt5agg"
 
     import lyse
@@ -444,12 +761,12 @@ if __name__ == '__main__':
     import labscript_utils.h5_lock, h5py
 
     from labscript_utils.modulewatcher import ModuleWatcher
+    from labscript_utils.labconfig import LabConfig
 
-    process_tree = ProcessTree.connect_to_parent()
-    to_parent = process_tree.to_parent
-    from_parent = process_tree.from_parent
-    kill_lock = process_tree.kill_lock
     filepath = from_parent.get()
+    if filepath is None:
+        # We were a spare worker that was never given an analysis routine to run:
+        sys.exit(0)
 
     # Rename this module to _analysis_subprocess and put it in sys.modules
     # under that name. The user's analysis routine will become the __main__ module
@@ -130,14 +130,12 @@ def pad_columns(df, n):
     """Add depth to hiererchical column labels with empty strings"""
     if df.columns.nlevels == n:
         return df
-    new_columns = []
-    data = {}
-    for column in df.columns:
-        new_column = column + ('',)*(n-len(column))
-        new_columns.append(new_column)
-        data[new_column] = df[column]
-    index = pandas.MultiIndex.from_tuples(new_columns)
-    return pandas.DataFrame(data,columns = index)
+    new_columns = [column + ('',)*(n-len(column)) for column in df.columns]
+    # Relabel a shallow copy rather than building a new dataframe column by
+    # column, which copies all the data and leaves it fragmented:
+    df = df.copy(deep=False)
+    df.columns = pandas.MultiIndex.from_tuples(new_columns)
+    return df
 
 def concat_with_padding(*dataframes):
     """Concatenates dataframes with MultiIndex column labels,
@@ -21,7 +21,8 @@ class FigureManager(object):
         self._figure = matplotlib.pyplot.figure
         self._close = matplotlib.pyplot.close
         self._show = matplotlib.pyplot.show
-        self.__allocated_figures = []
+        # Figure numbers allocated to a specific identifier this run:
+        self.__allocated_figures = set()
 
     def get_first_empty_figure(self, identifier, *args, **kwargs):
         i = 1
@@ -36,7 +37,7 @@ class FigureManager(object):
                 # (this stops "figure();figure();"" from generating multiple)
                 # empty figures
                 if identifier is not None:
-                    self.__allocated_figures.append(i)
+                    self.__allocated_figures.add(i)
                 return i, fig
             i += 1
             
@@ -69,7 +70,7 @@ class FigureManager(object):
                     """
                 sys.stderr.write(lyse.dedent(msg))
             self.figs[identifier] = fig
-            self.__allocated_figures.append(identifier)
+            self.__allocated_figures.add(identifier)
             self._remove_dead_references(identifier, fig)
                 
     def __call__(self,identifier=None, *args, **kwargs):
@@ -80,8 +81,7 @@ class FigureManager(object):
         elif identifier in self.figs:
             fig = self.figs[identifier]
             self._figure(fig.number)
-            if fig.number not in self.__allocated_figures:
-                self.__allocated_figures.append(fig.number)
+            self.__allocated_figures.add(fig.number)
         else:
             number, fig =  self.get_first_empty_figure(identifier, *args,**kwargs)
             self.figs[identifier] = fig
@@ -116,7 +116,7 @@ class FigureManager(object):
             self._show()
 
     def reset(self):
-        self.__allocated_figures = []
+        self.__allocated_figures = set()
 
     def _remove_dead_references(self, current_identifier, current_fig):
         for key, fig in list(self.figs.items()):